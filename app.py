@@ -1,40 +1,52 @@
+import time
+import numpy as np
+import pandas as pd
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from data_handler import read_excel_data, validate_data
-from optimizer import optimize_routes
+from optimizer import optimize_routes, pair_matrix
 from ui import setup_page_config, display_sidebar, display_depots_form, display_start_end_points, display_optimization_results
 
+# Copy-on-write lets derived DataFrames share the columns they do not change instead of copying them
+pd.set_option("mode.copy_on_write", True)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _optimize_routes_impl(key):
+    """
+    Run optimize_routes, memoized on a single hashable key of its inputs.
+    
+    The key collapses the arguments into one tuple, with dictionaries passed as tuples of items,
+    so hashing it is cheap and deterministic and the solver only runs again when an input actually changes.
+    Up to 32 results are kept in memory, trading memory for not solving again when an earlier input comes back.
+    """
+    bank, depots, start_point, end_point, direct_costs, fixed_decisions, driving_times, driving_distances, max_driving_time, max_routes, distance_rate, time_rate, time_limit, gap_rel = key
+    return optimize_routes(bank, list(depots), start_point, end_point, dict(direct_costs), dict(fixed_decisions), dict(driving_times), dict(driving_distances), max_driving_time, max_routes, distance_rate, time_rate, time_limit, gap_rel)
+
 def main():
     # Set up the page configuration
     setup_page_config()
 
-    # Application state initialization
-    if 'depots_data' not in st.session_state:
-        st.session_state.depots_data = None
-    if 'driving_info_data' not in st.session_state:
-        st.session_state.driving_info_data = None
-    if 'show_all_depots' not in st.session_state:
-        st.session_state.show_all_depots = False
-    if 'optimization_results' not in st.session_state:
-        st.session_state.optimization_results = None
-    if 'current_checkboxes' not in st.session_state:
-        st.session_state.current_checkboxes = {}
-    if 'current_costs' not in st.session_state:
-        st.session_state.current_costs = {}
-    if 'current_fixed_decisions' not in st.session_state:
-        st.session_state.current_fixed_decisions = {}
-    if 'current_start_point' not in st.session_state:
-        st.session_state.current_start_point = None
-    if 'current_end_point' not in st.session_state:
-        st.session_state.current_end_point = None
-    if 'driving_times' not in st.session_state:
-        st.session_state.driving_times = {}
-    if 'driving_distances' not in st.session_state:
-        st.session_state.driving_distances = {}
-    if 'direct_costs' not in st.session_state:
-        st.session_state.direct_costs = {}
+    # Application state initialization, written in one batch the first time the session runs
+    if 'executor' not in st.session_state:
+        st.session_state.update({
+            'depots_data': None,
+            'driving_info_data': None,
+            'show_all_depots': False,
+            'optimization_results': None,
+            'optimization_future': None,
+            'optimization_started': None,
+            # Optimizations run in a background thread so the page stays responsive while CBC solves
+            'executor': ThreadPoolExecutor(max_workers=1),
+            'uploaded_file_id': None,
+            'current_start_point': None,
+            'current_end_point': None,
+            'driving_times': {},
+            'driving_distances': {},
+            'direct_costs': pd.Series(dtype=float),
+        })
 
     # Sidebar for parameters
-    max_driving_time, max_routes, gas_cost, staff_cost = display_sidebar()
+    max_driving_time, max_routes, gas_cost, staff_cost, time_limit, gap_rel = display_sidebar()
 
     st.title("Route Optimization Application")
 
@@ -43,21 +55,16 @@ def main():
 
     if uploaded_file is not None:
         # Read and validate Excel file
-        success, message, depots_data, driving_info_data = read_excel_data(uploaded_file)
+        success, message, depots_data, driving_info_data, driving_times, driving_distances = read_excel_data(uploaded_file)
         
         if success:
-            # Store the data in session state
-            st.session_state.depots_data = depots_data
+            # Store the data in session state, only when a new file is uploaded so saved depot edits are kept
+            if st.session_state.uploaded_file_id != uploaded_file.file_id:
+                st.session_state.uploaded_file_id = uploaded_file.file_id
+                st.session_state.depots_data = depots_data
             st.session_state.driving_info_data = driving_info_data
-            
-            # Initialize checkbox data from the Included column if not already initialized
-            if not st.session_state.current_checkboxes:
-                for idx, row in depots_data.iterrows():
-                    depot_designation = row["Depot Designation"]
-                    included = True if row["Included"] == "Y" else False
-                    st.session_state.current_checkboxes[idx] = included
-                    st.session_state.current_costs[idx] = row["Direct Shipment Cost"]
-                    st.session_state.current_fixed_decisions[idx] = row["Fixed Decision"]
+            st.session_state.driving_times = driving_times
+            st.session_state.driving_distances = driving_distances
             
             if not st.session_state.current_start_point:
                 st.session_state.current_start_point = depots_data.iloc[0]["Depot Designation"]
@@ -72,9 +79,8 @@ def main():
         # Display the depots form
         display_depots_form()
         
-        # Get only the included depots (based on current checkboxes)
-        included_indices = [idx for idx, checked in st.session_state.current_checkboxes.items() if checked]
-        included_depots = st.session_state.depots_data.loc[included_indices]
+        # Get only the included depots (based on the Included column)
+        included_depots = st.session_state.depots_data[st.session_state.depots_data["Included"] == "Y"]
         
         # Identify the bank (first depot in the list)
         bank = st.session_state.depots_data.iloc[0]["Depot Designation"]
@@ -89,60 +95,72 @@ def main():
         if st.button("Optimize Route"):
             # Prepare data for optimization
             
-            # Create cost dictionary
-            direct_costs = {}
-            for idx, row in included_depots.iterrows():
-                direct_costs[row["Depot Designation"]] = st.session_state.current_costs[idx]
-            
-            # Create a fixed decisions dictionary
-            fixed_decisions = {}
-            for idx, row in included_depots.iterrows():
-                fixed_decisions[row["Depot Designation"]] = st.session_state.current_fixed_decisions[idx]
-            
-            # Create driving times dictionary
-            driving_times = {}
-            for idx, row in st.session_state.driving_info_data.iterrows():
-                depot1 = row["Depot 1 Designation"]
-                depot2 = row["Depot 2 Designation"]
-                time = float(row["Driving Time (minutes)"])
-                driving_times[(depot1, depot2)] = time
+            # Create cost and fixed decisions dictionaries from the columns, without building a Series per row
+            designations = included_depots["Depot Designation"].to_numpy()
+            direct_costs = dict(zip(designations, included_depots["Direct Shipment Cost"].to_numpy(dtype=float).tolist()))
+            fixed_decisions = dict(zip(designations, included_depots["Fixed Decision"].to_numpy()))
             
-            # Create driving distances dictionary
-            driving_distances = {}
-            for idx, row in st.session_state.driving_info_data.iterrows():
-                depot1 = row["Depot 1 Designation"]
-                depot2 = row["Depot 2 Designation"]
-                distance = float(row["Driving Distance (miles)"])
-                driving_distances[(depot1, depot2)] = distance
+            # Driving times and distances dictionaries are built when the file is loaded
+            driving_times = st.session_state.driving_times
+            driving_distances = st.session_state.driving_distances
 
             
             # Remove bank from list if it's there, as we handle it separately for optimization
             if bank in included_depot_designations:
                 included_depot_designations.remove(bank)
             
-            # Store for displaying results
-            st.session_state.driving_times = driving_times
-            st.session_state.driving_distances = driving_distances
-            st.session_state.direct_costs = direct_costs
+            # Store for displaying results, as a Series so the costs of the direct shipments are read in one lookup
+            st.session_state.direct_costs = pd.Series(direct_costs, dtype=float)
             
+            # Driving times and distances as matrices over the depots, so results are displayed without per-leg lookups
+            location_index = {designation: i for i, designation in enumerate(st.session_state.depots_data["Depot Designation"])}
+            st.session_state.location_index = location_index
+            # Both are stacked into one array, so a single gather reads the time and distance of every leg
+            # Single precision is plenty for minutes and miles shown to two decimals, and halves the memory;
+            # the matrices are allocated as float32 directly so no double precision copy is ever built
+            st.session_state.driving_matrix = np.stack([
+                pair_matrix(driving_times, location_index, missing=0.0, dtype=np.float32),
+                pair_matrix(driving_distances, location_index, missing=0.0, dtype=np.float32)
+            ])
             
-            # Perform optimization
-            try:
-                results = optimize_routes(
+            
+            # Start the optimization in the background
+            # Earlier results are cleared, since they no longer match the lookups stored above for the new solve
+            st.session_state.optimization_results = None
+            st.session_state.optimization_started = time.monotonic()
+            # The dictionaries are built from the file in a fixed order, so their items form a stable key without
+            # sorting (which would fail on designations mixing numbers and text)
+            optimization_key = (
                     bank,
-                    included_depot_designations,
+                    tuple(included_depot_designations),
                     st.session_state.start_point,
                     st.session_state.end_point,
-                    direct_costs,
-                    fixed_decisions,
-                    driving_times,
-                    driving_distances,
+                    tuple(direct_costs.items()),
+                    tuple(fixed_decisions.items()),
+                    tuple(driving_times.items()),
+                    tuple(driving_distances.items()),
                     max_driving_time * 60,  # Convert to minutes
                     max_routes,
                     gas_cost,
-                    staff_cost / 60 # Convert to $/minute
+                    staff_cost / 60, # Convert to $/minute
+                    time_limit,
+                    gap_rel
                     )
-                st.session_state.optimization_results = results
+            st.session_state.optimization_future = st.session_state.executor.submit(_optimize_routes_impl, optimization_key)
+        
+        # Wait for a running optimization within this run, updating its progress bar until it finishes
+        # A widget interaction interrupts the wait with a new run, which picks the same future up again
+        future = st.session_state.optimization_future
+        if future is not None:
+            progress_bar = st.progress(0.0, text="Optimizing routes...")
+            while not future.done():
+                elapsed = time.monotonic() - st.session_state.optimization_started
+                progress_bar.progress(min(elapsed / time_limit, 1.0), text=f"Optimizing routes... ({elapsed:.0f} s)")
+                time.sleep(0.5)
+            progress_bar.empty()
+            st.session_state.optimization_future = None
+            try:
+                st.session_state.optimization_results = future.result()
             except Exception as e:
                 st.error(f"Optimization error: {e}")
         
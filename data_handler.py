@@ -1,5 +1,6 @@
 import pandas as pd
 import streamlit as st
+from io import BytesIO
 
 def read_excel_data(uploaded_file):
     """
@@ -9,23 +10,41 @@ def read_excel_data(uploaded_file):
         uploaded_file: The uploaded Excel file object
     
     Returns:
-        Tuple containing (success, message, depots_data, driving_times_data)
+        Tuple containing (success, message, depots_data, driving_info_data, driving_times, driving_distances)
+    """
+    return load_workbook(uploaded_file.getvalue())
+
+@st.cache_data(show_spinner=False)
+def load_workbook(file_bytes):
+    """
+    Parse and validate an Excel workbook, and build the driving times and distances lookups.
+    
+    The result is cached on the file contents, so Streamlit reruns do not parse the file again.
+    
+    Args:
+        file_bytes: Contents of the uploaded Excel file
+    
+    Returns:
+        Tuple containing (success, message, depots_data, driving_info_data, driving_times, driving_distances)
     """
     try:
-        # Read the Excel file
-        depots_data = pd.read_excel(uploaded_file, sheet_name="Depots")
-        driving_info_data = pd.read_excel(uploaded_file, sheet_name="Driving Info")
+        # Read both sheets of the Excel file in a single pass over the workbook
+        sheets = pd.read_excel(BytesIO(file_bytes), sheet_name=["Depots", "Driving Info"])
+        depots_data = sheets["Depots"]
+        driving_info_data = sheets["Driving Info"]
         
         # Validate the data
         validation_result = validate_data(depots_data, driving_info_data)
         
-        if validation_result[0]:
-            return True, "Data validated successfully", depots_data, driving_info_data
-        else:
-            return False, validation_result[1], None, None
+        if not validation_result[0]:
+            return False, validation_result[1], None, None, None, None
+        
+        driving_times = build_pair_lookup(driving_info_data, "Driving Time (minutes)")
+        driving_distances = build_pair_lookup(driving_info_data, "Driving Distance (miles)")
+        return True, "Data validated successfully", depots_data, driving_info_data, driving_times, driving_distances
             
     except Exception as e:
-        return False, f"Error reading Excel file: {e}", None, None
+        return False, f"Error reading Excel file: {e}", None, None, None, None
 
 def validate_data(depots_data, driving_info_data):
     """
@@ -48,6 +67,29 @@ def validate_data(depots_data, driving_info_data):
     
     return True, "Data validation successful"
 
+def build_pair_lookup(driving_info_data, value_column):
+    """
+    Build a lookup of driving info values keyed by depot pair.
+    
+    Pairs listed in only one direction are mirrored, so the lookup is symmetric
+    unless both directions are given explicitly.
+    
+    Args:
+        driving_info_data: DataFrame containing driving times and distances
+        value_column: Name of the column holding the values (e.g. "Driving Time (minutes)")
+    
+    Returns:
+        Dictionary mapping (depot1, depot2) tuples to values
+    """
+    depots1 = driving_info_data["Depot 1 Designation"].to_numpy()
+    depots2 = driving_info_data["Depot 2 Designation"].to_numpy()
+    values = driving_info_data[value_column].to_numpy(dtype=float).tolist()
+    
+    lookup = dict(zip(zip(depots1, depots2), values))
+    for (depot1, depot2), value in list(lookup.items()):
+        lookup.setdefault((depot2, depot1), value)
+    return lookup
+
 def prepare_optimization_data(included_depot_indices, depots_data, driving_times_data):
     """
     Prepare data for optimization based on selected depots.
@@ -64,20 +106,10 @@ def prepare_optimization_data(included_depot_indices, depots_data, driving_times
     included_depots = depots_data.loc[included_depot_indices]
     
     # Create cost dictionary
-    direct_costs = {}
-    for idx, row in included_depots.iterrows():
-        direct_costs[row["Depot Designation"]] = st.session_state.current_costs[idx]
-    
-    # Create driving times dictionary
-    driving_times = {}
-    for idx, row in driving_times_data.iterrows():
-        depot1 = row["Depot 1 Designation"]
-        depot2 = row["Depot 2 Designation"]
-        time = float(row["Driving Time (minutes)"])
-        driving_times[(depot1, depot2)] = time
-        # Ensure symmetry if not already provided
-        if (depot2, depot1) not in driving_times:
-            driving_times[(depot2, depot1)] = time
+    direct_costs = dict(zip(included_depots["Depot Designation"].to_numpy(), included_depots["Direct Shipment Cost"].to_numpy(dtype=float).tolist()))
+    
+    # Create driving times dictionary, mirrored where only one direction is given
+    driving_times = build_pair_lookup(driving_times_data, "Driving Time (minutes)")
     
     # Identify the bank (first depot in the list)
     bank = depots_data.iloc[0]["Depot Designation"]
@@ -1,6 +1,275 @@
+import os
+import numpy as np
 import pulp
+from collections import defaultdict
 
-def optimize_routes(bank, depots, start_point, end_point, direct_costs, fixed_decisions, driving_times, driving_distances, max_driving_time, max_routes, distance_rate, time_rate):
+# tmpfs mount used for the files PuLP and CBC exchange, on systems that have one
+SHARED_MEMORY_DIR = "/dev/shm"
+
+
+def pair_matrix(pair_values, location_index, missing=np.nan, dtype=np.float64):
+    """
+    Arrange values keyed by location pairs into a square matrix.
+    
+    Args:
+        pair_values: Dictionary mapping (location1, location2) tuples to values
+        location_index: Dictionary mapping location designations to row/column numbers
+        missing: Value used for pairs without an entry
+        dtype: NumPy dtype of the matrix
+    
+    Returns:
+        NumPy array where entry [i, j] is the value from location i to location j
+    """
+    matrix = np.full((len(location_index), len(location_index)), missing, dtype=dtype)
+    for (location1, location2), value in pair_values.items():
+        if location1 in location_index and location2 in location_index:
+            matrix[location_index[location1], location_index[location2]] = value
+    return matrix
+
+
+def build_solver(time_limit, gap_rel, cutoff=None):
+    """
+    Build the CBC solver used by optimize_routes.
+    
+    CBC runs multithreaded branch-and-cut with preprocessing, cuts, strong branching
+    and heuristics switched on, and stops once the relative MIP gap or the time limit is reached.
+    If the CBC_BIN environment variable points at a CBC build (e.g. one compiled
+    with multithread support), that binary is used instead of the one bundled with PuLP.
+    
+    Args:
+        time_limit: Maximum solve time in seconds
+        gap_rel: Relative MIP gap at which the search stops
+        cutoff: Objective value of a known feasible solution. If given, the solver is warm started
+            from the variables' initial values and discards nodes that cannot improve on it
+    
+    Returns:
+        A configured PuLP solver
+    """
+    solver_options = dict(
+        msg=False,
+        threads=max(1, (os.cpu_count() or 1) - 1),
+        timeLimit=time_limit,
+        gapRel=gap_rel,
+        presolve=True,
+        cuts=True,
+        strong=10,
+        options=["preprocess on", "passCuts 10", "heuristics on", "strategy 1"],
+    )
+    if cutoff is not None:
+        solver_options["warmStart"] = True
+        solver_options["options"].append(f"cutoff {cutoff}")
+    
+    cbc_bin = os.environ.get("CBC_BIN")
+    if cbc_bin:
+        solver = pulp.COIN_CMD(path=cbc_bin, **solver_options)
+    else:
+        solver = pulp.PULP_CBC_CMD(**solver_options)
+        if not solver.available():
+            raise Exception("CBC solver is not available. Set CBC_BIN to the path of a CBC executable.")
+    
+    # Exchange the model and solution files with CBC through memory (tmpfs) instead of disk where available
+    if os.path.isdir(SHARED_MEMORY_DIR) and os.access(SHARED_MEMORY_DIR, os.W_OK):
+        solver.tmpDir = SHARED_MEMORY_DIR
+    return solver
+
+def greedy_initial(bank, depots, start_point, end_point, direct_costs, fixed_decisions, arc_times, arc_costs, out_neighbors, max_driving_time, max_routes):
+    """
+    Find a feasible solution with a nearest-neighbor heuristic, used to warm start the solver.
+    
+    Each route leaves the bank and keeps moving to the nearest depot that must be visited, or whose
+    direct shipment costs more than the drive to it, as long as the route can still get back within
+    the maximum driving time. The first route passes through the start and end points. Depots that
+    are not visited send direct shipments.
+    
+    Args:
+        bank: Location id of the bank
+        depots: List of depot location ids
+        start_point: Location id of the start point
+        end_point: Location id of the end point
+        direct_costs: Dictionary mapping depot ids to direct shipment costs
+        fixed_decisions: Dictionary mapping depot ids to fixed decisions
+        arc_times: Dictionary mapping usable (i, j) arcs to driving times
+        arc_costs: Dictionary mapping usable (i, j) arcs to driving costs
+        out_neighbors: Dictionary mapping location ids to the locations reachable from them
+        max_driving_time: Maximum allowed driving time in minutes
+        max_routes: Maximum number of routes allowed
+    
+    Returns:
+        Tuple of (direct_set, routes, cost), or None if the heuristic found no feasible solution
+    """
+    ship_to_bank = {i for i in depots if fixed_decisions[i] == 'Ship to bank' and i != start_point and i != end_point}
+    must_visit = {i for i in depots if fixed_decisions[i] == 'Wait for pickup'}
+    unvisited = set(depots) - ship_to_bank - {start_point, end_point}
+    
+    routes = []
+    for k in range(max_routes):
+        if k > 0 and not must_visit & unvisited:
+            break
+        
+        # The first route is bank -> start point -> ... -> end point -> bank
+        route = [bank]
+        last_stops = [bank]
+        if k == 0 and start_point != bank:
+            route.append(start_point)
+        if k == 0 and end_point != bank and end_point != start_point:
+            last_stops = [end_point, bank]
+        route_time = sum(arc_times.get(arc, float("inf")) for arc in zip(route, route[1:]))
+        closing_time = sum(arc_times.get(arc, float("inf")) for arc in zip(last_stops, last_stops[1:]))
+        
+        # A route that starts and ends at the same depot other than the bank cannot visit other depots
+        can_extend = not (k == 0 and start_point != bank and start_point == end_point)
+        while can_extend:
+            current = route[-1]
+            nearest = None
+            for j in out_neighbors[current]:
+                if j not in unvisited or (j not in must_visit and arc_costs[current, j] >= direct_costs[j]):
+                    continue
+                if route_time + arc_times[current, j] + arc_times.get((j, last_stops[0]), float("inf")) + closing_time > max_driving_time:
+                    continue
+                if nearest is None or arc_costs[current, j] < arc_costs[current, nearest]:
+                    nearest = j
+            if nearest is None:
+                break
+            route_time += arc_times[current, nearest]
+            route.append(nearest)
+            unvisited.discard(nearest)
+        
+        # Nothing to visit on this route
+        if route == [bank] and last_stops == [bank]:
+            break
+        
+        route += last_stops
+        if any(arc not in arc_times for arc in zip(route, route[1:])):
+            return None
+        if sum(arc_times[arc] for arc in zip(route, route[1:])) > max_driving_time:
+            return None
+        routes.append(route)
+    
+    if must_visit & unvisited:
+        return None
+    
+    visited = {i for route in routes for i in route}
+    direct_set = set(depots) - visited
+    cost = sum(direct_costs[i] for i in direct_set) + sum(arc_costs[arc] for route in routes for arc in zip(route, route[1:]))
+    return direct_set, routes, cost
+
+def trim_route(route, bank, start_point, end_point):
+    """
+    Cut a route driven from the bank back to the bank down to the part reported to the user.
+    
+    The legs from the bank to a start point other than the bank, and from an end point other than
+    the bank back to it, are driven but not shown as part of the route.
+    
+    Args:
+        route: List of location ids of the route, starting and ending at the bank
+        bank: Location id of the bank
+        start_point: Location id of the start point
+        end_point: Location id of the end point
+    
+    Returns:
+        List of location ids from the start point to the end point, or None if that is a single stop
+    """
+    trimmed = route[(0 if start_point == bank else 1):(None if end_point == bank else -1)]
+    return trimmed if len(trimmed) > 1 else None
+
+def held_karp_route(bank, depots, start_point, end_point, direct_costs, fixed_decisions, times, costs, max_driving_time, max_free_depots=12):
+    """
+    Solve the single-route problem exactly with the Held-Karp dynamic program.
+    
+    best[mask, j] is the cheapest way to drive from the start point through the free depots in mask,
+    ending at free depot j; each depot left out of the route sends a direct shipment. The program
+    ignores the maximum driving time, so its solution is only returned when the route it finds also
+    respects that limit (it is then optimal for the constrained problem too).
+    
+    Args:
+        bank: Location id of the bank
+        depots: List of depot location ids
+        start_point: Location id of the start point
+        end_point: Location id of the end point
+        direct_costs: Dictionary mapping depot ids to direct shipment costs
+        fixed_decisions: Dictionary mapping depot ids to fixed decisions
+        times: Matrix of driving times between locations
+        costs: Matrix of driving costs between locations, inf where an arc cannot be used
+        max_driving_time: Maximum allowed driving time in minutes
+        max_free_depots: Largest number of depots with an open decision the program is used for
+    
+    Returns:
+        Tuple of (direct_set, routes, cost), or None if the problem is too large or the program's
+        route exceeds the maximum driving time. Routes run from the start point to the end point,
+        as trimmed by trim_route
+    """
+    ship_to_bank = {i for i in depots if fixed_decisions[i] == 'Ship to bank' and i != start_point and i != end_point}
+    free = [i for i in depots if i not in ship_to_bank and i != start_point and i != end_point]
+    n_free = len(free)
+    if n_free > max_free_depots:
+        return None
+    
+    # Fixed parts of the route before and after the free depots
+    head = [bank] if start_point == bank else [bank, start_point]
+    tail = [bank] if end_point == bank else [end_point, bank]
+    if start_point != bank and start_point == end_point:
+        tail = [bank]
+    head_cost = sum(costs[arc] for arc in zip(head, head[1:]))
+    tail_cost = sum(costs[arc] for arc in zip(tail, tail[1:]))
+    
+    # Subsets of free depots as bitmasks, with the direct costs they avoid and whether they visit every required depot
+    masks = np.arange(1 << n_free)
+    in_mask = (masks[:, None] >> np.arange(n_free)) & 1
+    free_direct = np.array([direct_costs[i] for i in free], dtype=np.float64)
+    avoided_direct = in_mask @ free_direct
+    required = np.array([fixed_decisions[i] == 'Wait for pickup' for i in free], dtype=bool)
+    complete = in_mask[:, required].all(axis=1)
+    base_direct = sum(direct_costs[i] for i in ship_to_bank) + free_direct.sum()
+    
+    # Cheapest route with no free depots; a route that only goes bank -> bank is no route at all
+    if head == [bank] and tail == [bank]:
+        best_cost, best_route = base_direct, None
+    else:
+        best_cost, best_route = base_direct + head_cost + costs[head[-1], tail[0]] + tail_cost, head + tail
+    if not complete[0]:
+        best_cost, best_route = np.inf, None
+    
+    # A route starting and ending at the same depot other than the bank cannot visit other depots
+    if n_free > 0 and not (start_point != bank and start_point == end_point):
+        free_costs = costs[np.ix_(free, free)]
+        best = np.full((1 << n_free, n_free), np.inf)
+        previous = np.full((1 << n_free, n_free), -1, dtype=np.int64)
+        best[1 << np.arange(n_free), np.arange(n_free)] = head_cost + costs[head[-1], free]
+        
+        for mask in range(1, 1 << n_free):
+            if not np.isfinite(best[mask]).any():
+                continue
+            candidates = best[mask][:, None] + free_costs
+            from_depot = candidates.argmin(axis=0)
+            extended = candidates[from_depot, np.arange(n_free)]
+            outside = np.flatnonzero(in_mask[mask] == 0)
+            new_masks = mask | (1 << outside)
+            improved = extended[outside] < best[new_masks, outside]
+            best[new_masks[improved], outside[improved]] = extended[outside][improved]
+            previous[new_masks[improved], outside[improved]] = from_depot[outside][improved]
+        
+        totals = best + (costs[free, tail[0]] + tail_cost)[None, :] + (base_direct - avoided_direct)[:, None]
+        totals[~complete] = np.inf
+        mask, last = np.unravel_index(totals.argmin(), totals.shape)
+        if totals[mask, last] < best_cost:
+            # Walk back through the program to recover the order of the free depots
+            order = []
+            while last >= 0:
+                order.append(free[last])
+                mask, last = mask ^ (1 << last), previous[mask, last]
+            best_cost, best_route = float(totals.min()), head + order[::-1] + tail
+    
+    if not np.isfinite(best_cost):
+        return None
+    if best_route is None:
+        return set(depots), [], float(best_cost)
+    if sum(times[arc] for arc in zip(best_route, best_route[1:])) > max_driving_time:
+        return None
+    # Report the route the same way the model's solution is decoded
+    shown_route = trim_route(best_route, bank, start_point, end_point)
+    return set(depots) - set(best_route), [shown_route] if shown_route is not None else [], float(best_cost)
+
+def optimize_routes(bank, depots, start_point, end_point, direct_costs, fixed_decisions, driving_times, driving_distances, max_driving_time, max_routes, distance_rate, time_rate, time_limit=60, gap_rel=0.01):
     """
     Optimize routes using PuLP.
     
@@ -17,114 +286,236 @@ def optimize_routes(bank, depots, start_point, end_point, direct_costs, fixed_de
         max_routes: Maximum number of routes allowed
         distance_rate: Distance cost ($/mile) for the created route
         time_rate: Time cost ($/minute) for the created route
+        time_limit: Maximum solve time in seconds
+        gap_rel: Relative MIP gap at which the solver stops
     
     Returns:
         Dictionary with optimization results
     """
-    # Create the optimization problem
-    prob = pulp.LpProblem("Route_Optimization", pulp.LpMinimize)
+    # Number the locations so the model is indexed by integers: the bank is 0 and the depots follow
+    names = [bank] + depots
+    location_index = {name: i for i, name in enumerate(names)}
+    bank, start_point, end_point = 0, location_index[start_point], location_index[end_point]
+    depots = list(range(1, len(names)))
+    direct_costs = {i: float(direct_costs[names[i]]) for i in depots}
+    fixed_decisions = {i: fixed_decisions[names[i]] for i in depots}
     
-    # Decision variables
-    # direct_shipment[i] = 1 if depot i sends direct shipment, 0 otherwise
-    direct_shipment = pulp.LpVariable.dicts("direct", depots, cat=pulp.LpBinary)
+    # Driving times (nan where unknown) and distances between the numbered locations
+    times = pair_matrix(driving_times, location_index)
+    distances = pair_matrix(driving_distances, location_index, missing=0.0)
+    
+    # Only arcs with a known driving time that fits in a route can be travelled
+    usable = times <= max_driving_time
+    np.fill_diagonal(usable, False)
+    
+    # Driving cost of every usable arc, computed once for the whole matrix
+    costs = np.where(usable, times*time_rate + distances*distance_rate, np.inf)
+    
+    # Small single-route problems are solved exactly without building the model
+    if max_routes == 1:
+        exact_solution = held_karp_route(bank, depots, start_point, end_point, direct_costs, fixed_decisions, times, costs, max_driving_time)
+        if exact_solution is not None:
+            exact_direct, exact_routes, exact_cost = exact_solution
+            return {
+                "direct_shipments": {names[i]: True for i in depots if i in exact_direct},
+                "routes": [[names[i] for i in route] for route in exact_routes],
+                "total_cost": exact_cost
+            }
     
-    # link[i,j,k] = 1 if we travel from depot i to depot j in route k, 0 otherwise
-    all_locations = [bank] + depots
     all_routes = list(range(1,max_routes+1)) 
-    link = pulp.LpVariable.dicts("route", [(i, j, k) for i in all_locations for j in all_locations for k in all_routes if i != j], cat=pulp.LpBinary)
+    arc_from, arc_to = np.nonzero(usable)
+    arcs = list(zip(arc_from.tolist(), arc_to.tolist()))
     
-    # u[i,k] is the position of depot i in route k (for subtour elimination)
-    u = pulp.LpVariable.dicts("position", [(i,k) for i in depots for k in all_routes], lowBound=1, upBound=len(depots), cat=pulp.LpInteger)
+    # Locations reachable from each location through the arcs
+    out_neighbors = defaultdict(list)
+    for (i, j) in arcs:
+        out_neighbors[i].append(j)
+    
+    # Driving time and cost of each arc, looked up once and shared by the objective and constraints
+    arc_times = dict(zip(arcs, times[arc_from, arc_to].tolist()))
+    arc_costs = dict(zip(arcs, costs[arc_from, arc_to].tolist()))
+    
+    if start_point != bank and (bank, start_point) not in arc_times:
+        raise Exception(f"No driving time within the maximum driving time from {names[bank]} to the start point {names[start_point]}")
+    if end_point != bank and (end_point, bank) not in arc_times:
+        raise Exception(f"No driving time within the maximum driving time from the end point {names[end_point]} to {names[bank]}")
+    
+    # Symmetry breaking applies when routes start and end at the bank and driving times and distances are symmetric:
+    # every route then costs the same driven in reverse
+    usable_times = np.where(usable, times, 0.0)
+    usable_distances = np.where(usable, distances, 0.0)
+    symmetric = start_point == bank and end_point == bank and np.array_equal(usable, usable.T) and \
+                np.allclose(usable_times, usable_times.T) and np.allclose(usable_distances, usable_distances.T)
+    
+    # Depots whose decision is fixed in advance get no direct shipment variable: the constant is substituted in the rows
+    ship_direct = {i for i in depots if fixed_decisions[i] == 'Ship to bank' and i!=start_point and i!=end_point}
+    free_depots = [i for i in depots if i not in ship_direct and fixed_decisions[i] != 'Wait for pickup']
+    fixed_direct_cost = sum(direct_costs[i] for i in ship_direct)
+    
+    # Create the optimization problem
+    # The model is built column by column: the objective and the constraints are created empty first,
+    # then each variable is inserted into all of them at once through a {row: coefficient} column,
+    # which avoids building and copying intermediate expressions
+    prob = pulp.LpProblem("Route_Optimization", pulp.LpMinimize)
     
     # Objective function: minimize total cost
     # Cost of direct shipments + cost of routing: time + distance
-    objective = pulp.lpSum([direct_costs[i] * direct_shipment[i] for i in depots]) + \
-                pulp.lpSum([( driving_times.get((i, j), 0)*time_rate + driving_distances.get((i,j), 0)*distance_rate) * link[i, j, k] for i in all_locations for j in all_locations for k in all_routes if i != j])
-    prob += objective
+    objective = pulp.LpConstraintVar("objective")
+    prob.setObjective(objective)
     
     # Constraints
     
-    #Honor fixed decisions
-    for i in depots:
-        if fixed_decisions[i] == 'Ship to bank' and i!=start_point and i!=end_point:
-            prob += direct_shipment[i] == 1
-        elif fixed_decisions[i] == 'Wait for pickup':
-            prob += direct_shipment[i] == 0
-        else: 
-            0
-        
-    
     # Each depot is either visited or sends direct shipment
-    for i in depots:
-        prob += direct_shipment[i] + pulp.lpSum([link[j, i, k] for j in all_locations for k in all_routes if j != i]) == 1
+    # (a depot fixed to send direct shipment is not visited)
+    visit = {i: pulp.LpConstraintVar(f"visit_{i}", pulp.LpConstraintEQ, 0 if i in ship_direct else 1) for i in depots}
     
     # Flow conservation: if a depot is visited, we must leave it
-    for i in depots:
-        for k in all_routes:
-            prob += pulp.lpSum([link[i, j, k] for j in all_locations if j != i]) == pulp.lpSum([link[j, i, k] for j in all_locations if j != i])
+    conservation = {(i, k): pulp.LpConstraintVar(f"conservation_{i}_{k}", pulp.LpConstraintEQ, 0) for i in depots for k in all_routes}
     
     # The bank is left at most max_routes times
-    prob += pulp.lpSum([link[bank, j, k] for j in depots for k in all_routes]) <= max_routes
+    bank_departures = pulp.LpConstraintVar("bank_departures", pulp.LpConstraintLE, max_routes)
     
     # The bank is reached the same number of times it is left
-    prob += pulp.lpSum([link[bank, j, k] for j in depots for k in all_routes]) == pulp.lpSum([link[j, bank, k] for j in depots for k in all_routes])
+    bank_balance = pulp.LpConstraintVar("bank_balance", pulp.LpConstraintEQ, 0)
     
-    # Enforcing a "start_point" that is not the bank
-    if start_point != bank:
-        prob += pulp.lpSum([link[bank, start_point, k] for k in all_routes]) == 1
+    # Enforcing a "start_point" and an "end_point" that are not the bank
+    start_departure = pulp.LpConstraintVar("start_point", pulp.LpConstraintEQ, 1)
+    end_arrival = pulp.LpConstraintVar("end_point", pulp.LpConstraintEQ, 1)
+    
+    # Subtour elimination constraints (single-commodity flow formulation)
+    # Flow can only be carried along links used by a route, and each visited depot keeps one unit of the flow it receives
+    capacity = {(i, j): pulp.LpConstraintVar(f"capacity_{i}_{j}", pulp.LpConstraintLE, 0) for (i, j) in arcs}
+    # A link into a depot carries at least the unit that depot keeps, which tightens the LP relaxation
+    carry = {(i, j): pulp.LpConstraintVar(f"carry_{i}_{j}", pulp.LpConstraintLE, 0) for (i, j) in arcs if j != bank}
+    flow_balance = {i: pulp.LpConstraintVar(f"flow_balance_{i}", pulp.LpConstraintEQ, 0 if i in ship_direct else 1) for i in depots}
     
-    # Enforcing an "end_point" that is not the bank
+    # Route time constraint
+    # This is a simplification and may need to be refined for actual use
+    route_time = {k: pulp.LpConstraintVar(f"route_time_{k}", pulp.LpConstraintLE, max_driving_time) for k in all_routes}
+    
+    # Symmetry breaking: only the direction whose first depot has the lower id is allowed
+    orientation = {k: pulp.LpConstraintVar(f"orientation_{k}", pulp.LpConstraintLE, 0) for k in all_routes} if symmetric else {}
+    
+    # Route numbers are interchangeable, so routes are used in order: route k+1 only leaves the bank if route k does
+    route_order = {k: pulp.LpConstraintVar(f"route_order_{k}", pulp.LpConstraintLE, 0) for k in all_routes[:-1]}
+    
+    # All rows are added to the problem in one call rather than one += per row
+    rows = [*visit.values(), *conservation.values(), bank_departures, bank_balance, *capacity.values(), *carry.values(), *flow_balance.values(), *route_time.values(), *orientation.values(), *route_order.values()]
+    if start_point != bank:
+        rows.append(start_departure)
     if end_point != bank:
-        prob += pulp.lpSum([link[end_point, bank, k] for k in all_routes]) == 1
+        rows.append(end_arrival)
+    prob.extend([row.constraint for row in rows])
     
+    # Decision variables
+    # Variables get short names built from their integer indices, which only saves formatting tuple indices into names
+    # in Python: PuLP renames the variables in the file it writes for CBC anyway
+    # direct_shipment[i] = 1 if depot i sends direct shipment, 0 otherwise (only for depots without a fixed decision)
+    direct_shipment = {}
+    for i in free_depots:
+        direct_shipment[i] = pulp.LpVariable(f"d{i}", cat=pulp.LpBinary, e=pulp.LpAffineExpression({objective: direct_costs[i], visit[i]: 1, flow_balance[i]: 1}))
     
-    # Subtour elimination constraints (MTZ formulation)
-    M = len(depots)
-    for i in depots:
-        for j in depots:
-            for k in all_routes:
-                if i != j:
-                    prob += u[i, k] - u[j, k] + M * link[i, j, k] <= M - 1
+    # link[i,j,k] = 1 if we travel from depot i to depot j in route k, 0 otherwise
+    link = {}
+    for (i, j) in arcs:
+        for k in all_routes:
+            # Capacity coefficient: the bank can send a unit to every depot, a depot keeps one of the units it receives
+            column = {
+                objective: arc_costs[i, j],
+                route_time[k]: arc_times[i, j],
+                capacity[i, j]: -(len(depots) if i == bank else len(depots) - 1),
+            }
+            if i == bank:
+                column[bank_departures] = 1
+                column[bank_balance] = 1
+                if symmetric:
+                    column[orientation[k]] = j
+                if j == start_point:
+                    column[start_departure] = 1
+                if k in route_order:
+                    column[route_order[k]] = -1
+                if k - 1 in route_order:
+                    column[route_order[k - 1]] = 1
+            else:
+                column[conservation[i, k]] = 1
+            if j == bank:
+                column[bank_balance] = -1
+                if symmetric:
+                    column[orientation[k]] = -i
+                if i == end_point:
+                    column[end_arrival] = 1
+            else:
+                column[visit[j]] = 1
+                column[conservation[j, k]] = -1
+                column[carry[i, j]] = 1
+            link[i, j, k] = pulp.LpVariable(f"r{i}_{j}_{k}", cat=pulp.LpBinary, e=pulp.LpAffineExpression(column))
     
-    # Route time constraint
-    # This is a simplification and may need to be refined for actual use
-    for k in all_routes:
-        prob += pulp.lpSum([driving_times.get((i, j), 0) * link[i, j, k] for i in all_locations for j in all_locations if i != j]) <= max_driving_time
+    # flow[i,j] is the number of units carried from location i to location j (for subtour elimination)
+    # The bank supplies one unit to every visited depot, which cannot happen on a cycle that avoids the bank
+    # Integrality of the flow is not needed: any integer choice of links already admits an integer flow
+    flow = {}
+    for (i, j) in arcs:
+        column = {capacity[i, j]: 1}
+        if j != bank:
+            column[flow_balance[j]] = 1
+            column[carry[i, j]] = -1
+        if i != bank:
+            column[flow_balance[i]] = -1
+        flow[i, j] = pulp.LpVariable(f"f{i}_{j}", lowBound=0, cat=pulp.LpContinuous, e=pulp.LpAffineExpression(column))
+    
+    # Warm start the solver from a nearest-neighbor solution, if one is found
+    cutoff = None
+    initial_solution = greedy_initial(bank, depots, start_point, end_point, direct_costs, fixed_decisions, arc_times, arc_costs, out_neighbors, max_driving_time, max_routes)
+    if initial_solution is None and start_point == bank and end_point == bank and \
+            all(fixed_decisions[i] != 'Wait for pickup' for i in depots):
+        # Otherwise fall back to every depot sending direct shipment, which is feasible when no route is required
+        initial_solution = set(depots), [], sum(direct_costs.values())
+    if initial_solution is not None:
+        initial_direct, initial_routes, initial_cost = initial_solution
+        if symmetric:
+            initial_routes = [route if route[1] <= route[-2] else route[::-1] for route in initial_routes]
+        initial_links = {(i, j, k) for k, route in zip(all_routes, initial_routes) for (i, j) in zip(route, route[1:])}
+        for i, var in direct_shipment.items():
+            var.setInitialValue(1 if i in initial_direct else 0)
+        for key, var in link.items():
+            var.setInitialValue(1 if key in initial_links else 0)
+        # Slightly above the heuristic cost so that solution itself is not cut off
+        # The objective leaves out the cost of the fixed direct shipments
+        cutoff = initial_cost - fixed_direct_cost + 1e-4 * max(1.0, abs(initial_cost))
     
     # Solve the problem
-    prob.solve(pulp.PULP_CBC_CMD())
+    prob.solve(build_solver(time_limit, gap_rel, cutoff))
     
     # Check if the problem was solved successfully
     if pulp.LpStatus[prob.status] != "Optimal":
         raise Exception(f"Could not find an optimal solution. Status: {pulp.LpStatus[prob.status]}")
     
     # Extract results
-    direct_shipments = {i: direct_shipment[i].value() > 0.5 for i in depots if direct_shipment[i].value() > 0.5}
+    # Read each decision variable's value once: the depots sending direct shipments and the links used by the routes
+    direct_set = ship_direct | {i for i, var in direct_shipment.items() if var.varValue is not None and var.varValue > 0.5}
+    used_links = [key for key, var in link.items() if var.varValue is not None and var.varValue > 0.5]
+    direct_shipments = {names[i]: True for i in depots if i in direct_set}
     
     # Extract routes
+    # The location visited after each location on each route
+    next_hop = {(i, k): j for (i, j, k) in used_links}
+    
+    # Each route leaves the bank and follows its next hops back to it, and is then cut down to the start..end part
     routes = []
-    current_routes = []
-    
-    # Find the starting depots from the bank
-    for j in depots:
-        if j != start_point:
-            for k in all_routes:
-                if link[start_point, j, k].value() > 0.5:
-                    current_routes.append([start_point, j])
-        
-    # Complete each route
-    for route in current_routes:
-        while route[-1] != end_point:
-            current = route[-1]
-            for j in all_locations:
-                for k in all_routes:
-                    if j != current and link[current, j, k].value() > 0.5:
-                        route.append(j)
-                        break
-        routes.append(route)
+    for k in all_routes:
+        if (bank, k) in next_hop:
+            route = [bank, next_hop[bank, k]]
+            while route[-1] != bank:
+                route.append(next_hop[route[-1], k])
+            shown_route = trim_route(route, bank, start_point, end_point)
+            if shown_route is not None:
+                routes.append([names[stop] for stop in shown_route])
+    
+    # Total cost of the decoded solution, without evaluating the objective expression again
+    total_cost = sum(direct_costs[i] for i in direct_set) + sum(arc_costs[i, j] for (i, j, k) in used_links)
     
     return {
         "direct_shipments": direct_shipments,
         "routes": routes,
-        "total_cost": pulp.value(prob.objective)
+        "total_cost": total_cost
     }
\ No newline at end of file
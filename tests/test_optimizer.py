@@ -0,0 +1,151 @@
+from itertools import permutations
+
+import pytest
+
+pytest.importorskip("pulp")
+
+import optimizer
+
+
+BANK = "Bank"
+DEPOTS = ["A", "B", "C", "D"]
+POSITIONS = {BANK: 0, "A": 10, "B": 25, "C": 40, "D": 55}
+
+
+def small_instance(start_point=BANK, end_point=BANK, fixed_decisions=None, direct_cost=1000.0, max_driving_time=480):
+    """
+    Depots on a line, with direct shipments expensive enough by default that every depot is visited.
+
+    A small direction-dependent extra time makes the driving times asymmetric, so each case has a single optimal route.
+    """
+    locations = list(POSITIONS)
+    driving_distances = {
+        (i, j): float(abs(POSITIONS[i] - POSITIONS[j]))
+        for i in locations for j in locations if i != j
+    }
+    driving_times = {
+        (i, j): distance + (locations.index(i) + 5*locations.index(j)**2) % 7
+        for (i, j), distance in driving_distances.items()
+    }
+    decisions = {depot: "Not fixed" for depot in DEPOTS}
+    decisions.update(fixed_decisions or {})
+    return dict(
+        bank=BANK,
+        depots=list(DEPOTS),
+        start_point=start_point,
+        end_point=end_point,
+        direct_costs={depot: direct_cost for depot in DEPOTS},
+        fixed_decisions=decisions,
+        driving_times=driving_times,
+        driving_distances=driving_distances,
+        max_driving_time=max_driving_time,
+        max_routes=1,
+        distance_rate=0.1,
+        time_rate=0.2,
+    )
+
+
+def brute_force(instance):
+    """
+    Cheapest solution of a single-route instance, found by trying every order of every subset of depots.
+
+    Costs are summed from the driving dictionaries leg by leg, independently of the optimizer.
+
+    Returns:
+        Sorted list of (total cost, direct shipment depots, routes) of every feasible solution, cheapest first
+    """
+    bank, start_point, end_point = instance["bank"], instance["start_point"], instance["end_point"]
+    times, distances = instance["driving_times"], instance["driving_distances"]
+    fixed_decisions = instance["fixed_decisions"]
+    depots = instance["depots"]
+
+    solutions = []
+    others = [depot for depot in depots if depot not in (start_point, end_point)]
+    for size in range(len(others) + 1):
+        for order in permutations(others, size):
+            # A route starting and ending at the same depot other than the bank cannot visit anything else
+            if start_point == end_point != bank and order:
+                continue
+
+            # Depots picked up, in the order they are driven from the bank and back to it
+            visited = [start_point] if start_point != bank else []
+            visited += list(order)
+            if end_point not in (bank, start_point):
+                visited.append(end_point)
+            driven = [bank] + visited + [bank] if visited else []
+            legs = list(zip(driven, driven[1:]))
+
+            if any(fixed_decisions[depot] == "Wait for pickup" and depot not in visited for depot in depots):
+                continue
+            if any(fixed_decisions[depot] == "Ship to bank" for depot in order):
+                continue
+            if sum(times[leg] for leg in legs) > instance["max_driving_time"]:
+                continue
+
+            direct = [depot for depot in depots if depot not in visited]
+            cost = sum(instance["direct_costs"][depot] for depot in direct)
+            cost += sum(times[leg]*instance["time_rate"] + distances[leg]*instance["distance_rate"] for leg in legs)
+            routes = [] if start_point == end_point and not order else [[start_point] + list(order) + [end_point]]
+            solutions.append((cost, direct, routes))
+
+    return sorted(solutions, key=lambda solution: solution[0])
+
+
+def assert_matches(result, expected_cost, expected_direct, expected_routes):
+    assert sorted(result["direct_shipments"]) == expected_direct
+    assert result["routes"] == expected_routes
+    assert result["total_cost"] == pytest.approx(expected_cost)
+
+
+CASES = {
+    "bank to bank": dict(),
+    "depot to depot": dict(start_point="A", end_point="C"),
+    "bank to depot": dict(end_point="D"),
+    "depot to bank": dict(start_point="B"),
+    "same depot": dict(start_point="B", end_point="B"),
+    "ship to bank": dict(fixed_decisions={"C": "Ship to bank"}),
+    # Direct shipments are cheap here, so without the fixed decision no depot would be visited
+    "wait for pickup": dict(fixed_decisions={"C": "Wait for pickup"}, direct_cost=5.0),
+}
+
+
+def test_brute_force_by_hand():
+    # Bank -> D -> C -> B -> A -> Bank: times 58+15+17+15+11 = 116, distances 55+15+15+15+10 = 110
+    cost, direct, routes = brute_force(small_instance())[0]
+    assert cost == pytest.approx(116*0.2 + 110*0.1)
+    assert direct == []
+    assert routes == [[BANK, "D", "C", "B", "A", BANK]]
+
+
+@pytest.mark.parametrize("case", CASES.values(), ids=list(CASES))
+def test_held_karp_finds_brute_force_optimum(case):
+    solutions = brute_force(small_instance(**case))
+    # The instance is only a meaningful check when its optimum is unique
+    assert len(solutions) == 1 or solutions[1][0] > solutions[0][0] + 1e-6
+
+    assert_matches(optimizer.optimize_routes(**small_instance(**case)), *solutions[0])
+
+
+@pytest.mark.parametrize("case", CASES.values(), ids=list(CASES))
+def test_model_finds_brute_force_optimum(monkeypatch, case):
+    # Without the exact program, the instance goes through the PuLP model
+    monkeypatch.setattr(optimizer, "held_karp_route", lambda *args, **kwargs: None)
+
+    assert_matches(optimizer.optimize_routes(**small_instance(**case)), *brute_force(small_instance(**case))[0])
+
+
+def test_driving_time_limit_falls_through_to_model(monkeypatch):
+    # The unconstrained optimum drives 116 minutes, so the exact program gives up and the model solves the instance
+    instance = small_instance(max_driving_time=110)
+    exact_results = []
+    held_karp_route = optimizer.held_karp_route
+
+    def spy(*args, **kwargs):
+        exact_results.append(held_karp_route(*args, **kwargs))
+        return exact_results[-1]
+
+    monkeypatch.setattr(optimizer, "held_karp_route", spy)
+    result = optimizer.optimize_routes(**instance)
+
+    assert exact_results == [None]
+    assert_matches(result, *brute_force(instance)[0])
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+
+import ui
+
+
+def test_route_table_reads_legs_from_matrix():
+    # Times in [0] and distances in [1], with different values in each direction
+    driving_matrix = np.array([
+        [[0.0, 12.5, 30.0], [13.0, 0.0, 17.25], [31.0, 18.0, 0.0]],
+        [[0.0, 8.0, 20.5], [8.5, 0.0, 11.0], [21.0, 11.5, 0.0]],
+    ], dtype=np.float32)
+    location_index = {"X": 0, "Y": 1, "Z": 2}
+    distance_rate, time_rate = 0.13, 0.12
+
+    route_df, route_time, route_distance, route_cost = ui.build_route_table.__wrapped__(
+        ("X", "Y", "Z"), 0, distance_rate, time_rate, driving_matrix, location_index)
+
+    # X -> Y then Y -> Z
+    times = [12.5, 17.25]
+    distances = [8.0, 11.0]
+    costs = [t*time_rate + d*distance_rate for t, d in zip(times, distances)]
+
+    assert route_df["Stop #"].tolist() == [1, 2, 3]
+    assert route_df["Depot Designation"].tolist() == ["X", "Y", "Z"]
+    assert route_df.iloc[0, 2:].isna().all()
+    assert route_df["Driving Time (min)"].iloc[1:].tolist() == times
+    assert route_df["Driving Distance (miles)"].iloc[1:].tolist() == distances
+    assert route_df["Driving Cost ($)"].iloc[1:].tolist() == pytest.approx(costs, rel=1e-6)
+    assert route_time == pytest.approx(sum(times))
+    assert route_distance == pytest.approx(sum(distances))
+    assert route_cost == pytest.approx(sum(costs), rel=1e-6)
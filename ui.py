@@ -1,5 +1,24 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+
+# Column settings of the depot editor and the result tables, built once instead of on every rerun
+DEPOT_COLUMN_CONFIG = {
+    "Included": st.column_config.CheckboxColumn("Include"),
+    "Region": st.column_config.TextColumn("Region"),
+    "Depot Designation": st.column_config.TextColumn("Designation"),
+    "Depot Address": st.column_config.TextColumn("Address"),
+    "Direct Shipment Cost": st.column_config.NumberColumn("Direct Shipping Cost", step=0.01, format="$%.2f"),
+    "Fixed Decision": st.column_config.SelectboxColumn("Fixed Decision", options=['Not fixed', 'Ship to bank', 'Wait for pickup'], required=True),
+}
+DIRECT_COLUMN_CONFIG = {
+    "Direct Shipment Cost ($)": st.column_config.NumberColumn(format="$%.2f"),
+}
+ROUTE_COLUMN_CONFIG = {
+    "Driving Time (min)": st.column_config.NumberColumn(format="%.2f"),
+    "Driving Distance (miles)": st.column_config.NumberColumn(format="%.2f"),
+    "Driving Cost ($)": st.column_config.NumberColumn(format="$%.2f"),
+}
 
 def setup_page_config():
     """Set up the Streamlit page configuration."""
@@ -14,22 +33,31 @@ def display_sidebar():
     Display sidebar with optimization parameters.
     
     Returns:
-        Tuple of (max_driving_time, max_routes)
+        Tuple of (max_driving_time, max_routes, gas_cost, staff_cost, time_limit, gap_rel)
     """
-    st.sidebar.header("Optimization Parameters")
-    max_driving_time = st.sidebar.number_input("Maximum Driving Time (hours)", min_value=1.0, value=8.0, step=0.1)
-    #max_routes = st.sidebar.number_input("Maximum Number of Routes", min_value=1, max_value=10, value=1, step=1)
-    #Fixing max routes to 1 for now, since allowing the specification of start and end points significantly complicates the logic for more than 1 route
-    max_routes = 1
-    gas_price_per_gallon = st.sidebar.number_input("Gas Price ($/gallon)", min_value=0.0, value = 2.7, step = 0.01)
-    fuel_efficiency = st.sidebar.number_input("Fuel Efficiency (miles/gallon)", min_value = 0.01, value = 21.0, step = 0.01) 
-    
-    gas_cost = gas_price_per_gallon/fuel_efficiency
-    st.sidebar.write(f"Gas Cost Per Mile ($/mile) = {gas_cost:.2f}")
-    
-    staff_cost = st.sidebar.number_input("Staff Cost ($/hr)", min_value = 0.0, value = 7.25, step=0.01)
+    # The inputs are grouped in a form, so editing several of them triggers a single rerun when applied
+    with st.sidebar.form("sidebar_form"):
+        st.header("Optimization Parameters")
+        max_driving_time = st.number_input("Maximum Driving Time (hours)", min_value=1.0, value=8.0, step=0.1)
+        #max_routes = st.number_input("Maximum Number of Routes", min_value=1, max_value=10, value=1, step=1)
+        #Fixing max routes to 1 for now, since allowing the specification of start and end points significantly complicates the logic for more than 1 route
+        max_routes = 1
+        gas_price_per_gallon = st.number_input("Gas Price ($/gallon)", min_value=0.0, value = 2.7, step = 0.01)
+        fuel_efficiency = st.number_input("Fuel Efficiency (miles/gallon)", min_value = 0.01, value = 21.0, step = 0.01) 
+        
+        gas_cost = gas_price_per_gallon/fuel_efficiency
+        st.write(f"Gas Cost Per Mile ($/mile) = {gas_cost:.2f}")
+        
+        staff_cost = st.number_input("Staff Cost ($/hr)", min_value = 0.0, value = 7.25, step=0.01)
+        
+        st.header("Solver Settings")
+        time_limit = st.number_input("Solver Time Limit (seconds)", min_value=1, value=60, step=1)
+        #The solver stops as soon as it finds a solution within this percentage of the optimum
+        gap_percent = st.number_input("Optimality Gap (%)", min_value=0.0, max_value=100.0, value=1.0, step=0.1)
+        
+        st.form_submit_button("Apply")
     
-    return max_driving_time, max_routes, gas_cost, staff_cost
+    return max_driving_time, max_routes, gas_cost, staff_cost, time_limit, gap_percent / 100
 
 
 def display_depots_form():
@@ -42,91 +70,45 @@ def display_depots_form():
     # Display depots data with editable checkboxes
     st.subheader("Depots Data")
     
-    # Create a copy of the dataframe to avoid modification warnings
-    edited_depots = st.session_state.depots_data.copy()
+    # Session state entries used below, looked up once
+    session_state = st.session_state
+    depots_data = session_state.depots_data
+    
+    # The depots with typed columns for editing: a boolean Include checkbox and numeric costs
+    # The other columns share memory with the depots data instead of being copied on every rerun
+    depot_table = pd.DataFrame({
+        "Included": depots_data["Included"] == "Y",
+        "Region": depots_data["Region"],
+        "Depot Designation": depots_data["Depot Designation"],
+        "Depot Address": depots_data["Depot Address"],
+        "Direct Shipment Cost": depots_data["Direct Shipment Cost"].astype(float),
+        "Fixed Decision": depots_data["Fixed Decision"],
+    }, copy=False)
+    if not session_state.show_all_depots:
+        depot_table = depot_table[depot_table["Included"]]
     
     # Display the data in a form
     with st.form("depot_form"):
-        # Create a container for the form fields
-        form_container = st.container()
-        
-        # Display form fields
-        with form_container:
-            
-             # Create header row
-            col1, col2, col3, col4, col5, col6 = st.columns([1, 2, 3, 3, 2, 2])
-            with col1:
-                st.write("**Include**")
-            with col2:
-                st.write("**Region**")
-            with col3:
-                st.write("**Designation**")
-            with col4:
-                st.write("**Address**")
-            with col5:
-                st.write("**Direct Shipping Cost**")
-            with col6:
-                st.write('**Fixed Decision**')
-            
-            # Create checkboxes and input fields
-            for idx, row in edited_depots.iterrows():
-                current_checkbox = st.session_state.current_checkboxes.get(idx, False)
-                if st.session_state.show_all_depots or current_checkbox:
-                    col1, col2, col3, col4, col5, col6 = st.columns([1, 2, 3, 3, 2, 2])
-                    
-                    with col1:
-                        checkbox_value = st.checkbox(
-                            label="Included?",
-                            label_visibility = "hidden", 
-                            value=current_checkbox, 
-                            key=f"cb_{idx}"
-                        )
-                        st.session_state.current_checkboxes[idx] = checkbox_value
-                    
-                    with col2:
-                        st.text(row["Region"])
-                    
-                    with col3:
-                        st.text(row["Depot Designation"])
-                    
-                    with col4:
-                        st.text(row["Depot Address"])
-                    
-                    with col5:
-                        cost_value = st.number_input(
-                            label = "direct shipping cost",
-                            label_visibility = "hidden",
-                            value=float(st.session_state.current_costs.get(idx, row["Direct Shipment Cost"])),
-                            key=f"cost_{idx}",
-                            step=0.01
-                        )
-                        st.session_state.current_costs[idx] = cost_value
-                    
-                    with col6:
-                        option_values = ['Not fixed', 'Ship to bank', 'Wait for pickup']
-                        
-                        current_fixed_decision = st.session_state.current_fixed_decisions.get(idx, 'Not fixed')
-
-                        fixed_decision_value = st.selectbox(
-                            label="fixed decision",
-                            label_visibility="hidden",
-                            options = option_values,
-                            index = option_values.index(current_fixed_decision),
-                            key=f"fixed_{idx}"
-                        )
-                        st.session_state.current_fixed_decisions[idx] = fixed_decision_value
+        # A single editable table instead of one set of widgets per depot
+        edited_table = st.data_editor(
+            depot_table,
+            column_config=DEPOT_COLUMN_CONFIG,
+            disabled=["Region", "Depot Designation", "Depot Address"],
+            # With all depots shown, a fixed height keeps the table scrolling so only the visible rows are drawn
+            height=400 if session_state.show_all_depots else None,
+            hide_index=True,
+            num_rows="fixed",
+            key="depot_editor"
+        )
         
         submitted = st.form_submit_button("Save Depot Information Edits")
     
     if submitted:
-        # Update the dataframe with the new values
-        for idx in st.session_state.current_checkboxes:
-            if idx < len(edited_depots):
-                edited_depots.at[idx, "Included"] = "Y" if st.session_state.current_checkboxes[idx] else "N"
-                edited_depots.at[idx, "Direct Shipment Cost"] = st.session_state.current_costs[idx]
-                edited_depots.at[idx, "Fixed Decision"] = st.session_state.current_fixed_decisions[idx]
-        
-        st.session_state.depots_data = edited_depots
+        # Write the edits of the displayed depots back into the depots data, which holds the current state
+        # Only the edited columns are rebuilt, the other columns are shared with the current frame
+        edited_columns = ["Included", "Direct Shipment Cost", "Fixed Decision"]
+        edits = edited_table[edited_columns].assign(Included=np.where(edited_table["Included"].to_numpy(), "Y", "N"))
+        session_state.depots_data = depots_data.assign(**{column: edits[column].combine_first(depots_data[column]) for column in edited_columns})
         st.success("Changes saved successfully!")
 
 
@@ -168,29 +150,107 @@ def display_start_end_points(included_depot_designations):
  
 
 
+def route_legs(matrix, stops):
+    """
+    Gather the values of each leg of a route from matrices over the locations.
+    
+    Args:
+        matrix: NumPy array whose last two axes run over the locations, e.g. stacked driving times and distances
+        stops: NumPy integer array of the location indices visited by the route, in order
+    
+    Returns:
+        NumPy array with the leading axes of matrix and one value per leg along the last axis
+    """
+    return matrix[..., stops[:-1], stops[1:]]
+
+# The table caches are shared by every session of this long-running app, so their size is bounded
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_direct_table(direct_depots, direct_costs):
+    """
+    Build the table of depots sending direct shipments, cached on its inputs.
+    
+    Args:
+        direct_depots: Tuple of designations of the depots sending direct shipments
+        direct_costs: Series of direct shipment costs indexed by depot designation
+    
+    Returns:
+        Tuple of (direct shipments DataFrame, total direct shipment cost)
+    """
+    direct_depot_costs = direct_costs.reindex(list(direct_depots))
+    direct_df = pd.DataFrame({
+        "Depot Designation": list(direct_depots),
+        "Direct Shipment Cost ($)": direct_depot_costs.round(2).to_numpy()
+    })
+    return direct_df, direct_depot_costs.sum()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_route_table(route, driving_version, distance_rate, time_rate, _driving_matrix, _location_index):
+    """
+    Build the table of the stops of a route with the driving time, distance and cost of each leg.
+    
+    The cache is keyed on the route, the rates and driving_version only: the matrix and index are
+    passed unhashed, since hashing them would cost more than the gather being cached.
+    
+    Args:
+        route: Tuple of depot designations visited by the route, in order
+        driving_version: Value that changes whenever the driving matrix and location index are rebuilt
+        distance_rate: Distance cost ($/mile)
+        time_rate: Time cost ($/minute)
+        _driving_matrix: float32 NumPy array of the driving times ([0]) and distances ([1]) between the depots
+        _location_index: Dictionary mapping depot designations to matrix rows/columns
+    
+    Returns:
+        Tuple of (route DataFrame, route driving time, route driving distance, route driving cost)
+    """
+    # Driving time, distance and cost of each leg of the route, gathered from the matrices
+    # The rates are cast to float32 so the legs are not upcast to float64
+    distance_rate, time_rate = np.float32(distance_rate), np.float32(time_rate)
+    stops = np.fromiter((_location_index[depot] for depot in route), dtype=np.int32, count=len(route))
+    leg_times, leg_distances = route_legs(_driving_matrix, stops)
+    leg_costs = leg_times*time_rate + leg_distances*distance_rate
+    
+    # Create route data with driving costs, one preallocated array per column
+    # The first stop has no driving from a previous depot
+    n = len(route)
+    driving_columns = np.empty((3, n), dtype=np.float32)
+    driving_columns[:, 0] = np.nan
+    driving_columns[0, 1:] = leg_times
+    driving_columns[1, 1:] = leg_distances
+    driving_columns[2, 1:] = leg_costs
+    route_df = pd.DataFrame({
+        "Stop #": np.arange(1, n + 1, dtype=np.int32),
+        "Depot Designation": np.asarray(route, dtype=object),
+        "Driving Time (min)": driving_columns[0],
+        "Driving Distance (miles)": driving_columns[1],
+        "Driving Cost ($)": driving_columns[2]
+    })
+    
+    return route_df, leg_times.sum(), leg_distances.sum(), leg_costs.sum()
+
 def display_optimization_results(distance_rate, time_rate):
     """Display optimization results."""
     st.subheader("Optimization Results")
     
-    direct_shipments = st.session_state.optimization_results["direct_shipments"]
-    routes = st.session_state.optimization_results["routes"]
-    driving_times = st.session_state.driving_times
-    driving_distances = st.session_state.driving_distances
-    direct_costs = st.session_state.direct_costs
+    # Session state entries used below, looked up once
+    session_state = st.session_state
+    optimization_results = session_state.optimization_results
+    direct_shipments = optimization_results["direct_shipments"]
+    routes = optimization_results["routes"]
+    driving_matrix = session_state.driving_matrix
+    location_index = session_state.location_index
+    # The driving matrix and location index are rebuilt each time an optimization is started
+    driving_version = session_state.optimization_started
+    direct_costs = session_state.direct_costs
     
     total_cost = 0
     
-    # Display direct shipments in a table
+    # Display direct shipments in a table, inside an expander the user can collapse
     st.write("### Depots that will send direct shipments:")
     if direct_shipments:
-        direct_data = {
-            "Depot Designation": list(direct_shipments.keys()),
-            "Direct Shipment Cost ($)": [direct_costs[depot] for depot in direct_shipments]
-        }
-        direct_df = pd.DataFrame(direct_data).round(2)
-        st.dataframe(direct_df, hide_index=True)
+        direct_df, direct_total = build_direct_table(tuple(direct_shipments), direct_costs)
+        with st.expander(f"Direct shipments ({len(direct_shipments)} depot{'' if len(direct_shipments) == 1 else 's'})", expanded=True):
+            st.dataframe(direct_df, hide_index=True, column_config=DIRECT_COLUMN_CONFIG)
         
-        direct_total = sum(direct_costs[depot] for depot in direct_shipments)
         st.write(f"**Total direct shipment cost:** ${direct_total:.2f}")
         total_cost += direct_total
     else:
@@ -205,54 +265,25 @@ def display_optimization_results(distance_rate, time_rate):
         for i, route in enumerate(routes):
             st.write(f"**Route {i+1}:**")
             
-            # Create route data with driving costs
-            route_data = []
-            route_driving_time = 0
-            route_driving_distance = 0
-            route_driving_cost = 0
-            stop = 1
-            
-            for j in range(len(route)):
-                if j == 0:
-                    # First stop has no driving cost from previous
-                    route_data.append({
-                        "Stop #": stop,
-                        "Depot Designation": route[j],
-                        "Driving Time (min)": "",
-                        "Driving Distance (miles)": "",
-                        "Driving Cost ($)": ""
-                    })
-                else:
-                    # Calculate driving cost from previous depot
-                    from_depot = route[j-1]
-                    to_depot = route[j]
-                    driving_time = driving_times.get((from_depot, to_depot), 0)*time_rate
-                    route_driving_time += driving_time
-                    driving_distance = driving_distances.get((from_depot, to_depot), 0)*distance_rate
-                    route_driving_distance += driving_distance
-                    driving_cost = driving_time*time_rate + driving_distance*distance_rate 
-                    route_driving_cost += driving_cost
-                    stop += 1
-                    
-                    route_data.append({
-                        "Stop #": stop,
-                        "Depot Designation": to_depot,
-                        "Driving Time (min)": f"{driving_time:.2f}",
-                        "Driving Distance (miles)": f"{driving_distance:.2f}",
-                        "Driving Cost ($)": f"{driving_cost:.2f}"
-                    })
-            
             # Create and display the route table
-            route_df = pd.DataFrame(route_data)
-            st.dataframe(route_df, hide_index=True)
+            route_df, route_driving_time, route_driving_distance, route_driving_cost = build_route_table(
+                tuple(route), driving_version, distance_rate, time_rate, driving_matrix, location_index)
+            st.dataframe(
+                route_df,
+                hide_index=True,
+                column_config=ROUTE_COLUMN_CONFIG
+            )
             
             
-            st.write(f"**Route {i+1} time:** {route_driving_time:.2f} minutes ({route_driving_time/60:.2f} hours)")
-            st.write(f"**Route {i+1} distance:** {route_driving_distance:.2f} miles")
-            st.write(f"**Route {i+1} cost:** ${route_driving_cost:.2f}")
-            st.write("---")
+            # Route summary sent as a single markdown element
+            st.markdown(
+                f"**Route {i+1} time:** {route_driving_time:.2f} minutes ({route_driving_time/60:.2f} hours)\n\n"
+                f"**Route {i+1} distance:** {route_driving_distance:.2f} miles\n\n"
+                f"**Route {i+1} cost:** ${route_driving_cost:.2f}\n\n"
+                "---"
+            )
             total_cost += route_driving_cost
     else:
         st.write("No depots will be visited for pickups.")
         
-    st.write(f"### Overall total cost: ${total_cost:.2f}")
\ No newline at end of file
+    st.write(f"### Overall total cost: ${total_cost:.2f}")